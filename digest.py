@@ -1,28 +1,40 @@
 #!/usr/bin/env python3
 """
 Multi-channel Discord Digest
-Extracts daily digests from multiple Discord channels.
-EleutherAI: daily email. tinygrad + seats.aero: daily extraction, weekly rollup.
+Extracts digests at several resolutions (flash/daily/weekly/monthly) from
+multiple Discord channels with a single fetch per channel per run.
+Summaries compose hierarchically: hourly blocks -> days -> weeks -> months.
 """
 
 import json
 import os
 import re
 import sys
+import threading
 import time
+import urllib.parse
 import urllib.request
 import urllib.error
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from html.parser import HTMLParser
 
 # ── Config ──
-DISCORD_TOKEN = os.environ["DISCORD_TOKEN"]
-GEMINI_API_KEY = os.environ["GEMINI_API_KEY"]
+DISCORD_TOKEN = os.environ.get("DISCORD_TOKEN", "")
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN", "")
 GITHUB_REPO = os.environ.get("GITHUB_REPO", "")
 RESEND_API_KEY = os.environ.get("RESEND_API_KEY", "")
 EMAIL_TO = os.environ.get("EMAIL_TO", "jaison.sunny.george@gmail.com")
 DISCORD_EPOCH = 1420070400000
 HOURS = int(os.environ.get("HOURS", "24"))
+CACHE_DIR = os.environ.get("CACHE_DIR", ".cache")
+LINK_CACHE_TTL_DAYS = int(os.environ.get("LINK_CACHE_TTL_DAYS", "14"))
+LINK_WORKERS = int(os.environ.get("LINK_WORKERS", "8"))
+LINK_PER_HOST = 2           # max concurrent requests to one host
+LINK_HOST_DELAY = 1.0       # min seconds between request starts to one host
+LINK_MAX_BYTES = 256 * 1024
+GEMINI_RETRIES = 4          # retries on 429/5xx, with exponential backoff
 
 # ── Channel Configs ──
 CHANNELS = {
@@ -30,17 +42,17 @@ CHANNELS = {
         "name": "EleutherAI #off-topic",
         "guild_id": "729741769192767510",
         "channel_id": "730095596861521970",
-        "cadence": "daily",
+        "windows": ["daily", "monthly"],
         "label": "eleutherai",
         "email_subject": "EleutherAI Alpha Digest",
-        "prompt": """You are a sharp intelligence analyst writing a daily brief for a busy exec. They will skim this in 60 seconds. Every word must earn its place.
+        "prompt": """You are a sharp intelligence analyst writing a {period} brief for a busy exec. They will skim this in 60 seconds. Every word must earn its place.
 
 RULES:
 - Under 800 words total.
 - EVERY bullet MUST start with a bold actionable takeaway, then a dash, then 1-2 sentences of evidence. NO EXCEPTIONS.
 - Format: <b>Takeaway that answers "so what?"</b> — Evidence from the chat with specific names/tools/numbers.
 - If you can't explain why someone should care, cut the bullet.
-- If a section has nothing, write "Nothing today." One line.
+- If a section has nothing, write "Nothing this {span}." One line.
 - NEVER repeat a point.
 
 EVERY bullet MUST include a direct quote from the chat as evidence. Format:
@@ -56,14 +68,14 @@ EXAMPLES OF BAD BULLETS (do NOT write like this):
 - "Interest in SNNs remains limited." (vague, no evidence, no names)
 - "Codex's quality is questioned, with users reporting issues." (generic, no quote, who said what?)
 
-DATA: {msg_count} messages from EleutherAI #off-topic on {date_str}. These are ML researchers and infra engineers who ship.
+DATA: time-sliced notes condensed from {msg_count} messages in EleutherAI #off-topic, {date_str}. These are ML researchers and infra engineers who ship. Each section is headed by its UTC time range; quotes in the notes are verbatim from the chat.
 
 {messages}
 
 OUTPUT (use these exact section headers):
 
 TL;DR
-One bold sentence. The single most important signal today. Why it matters.
+One bold sentence. The single most important signal this {span}. Why it matters.
 
 TOOLING MOVES
 Real migrations — tools people are actually switching to or abandoning.
@@ -84,30 +96,30 @@ Repos, posts, or tools that sparked real discussion. Include the URL and why it
         "name": "tinygrad #general",
         "guild_id": "1068976834382925865",
         "channel_id": "1068976834928193609",
-        "cadence": "weekly",
+        "windows": ["daily", "weekly"],
         "label": "tinygrad",
         "email_subject": "tinygrad Weekly Digest",
-        "prompt": """You are a sharp intelligence analyst writing a daily brief for a busy exec. They will skim this in 60 seconds. Every word must earn its place.
+        "prompt": """You are a sharp intelligence analyst writing a {period} brief for a busy exec. They will skim this in 60 seconds. Every word must earn its place.
 
 RULES:
 - Under 800 words total.
 - EVERY bullet MUST start with a bold actionable takeaway, then a dash, then 1-2 sentences of evidence. NO EXCEPTIONS.
 - Format: <b>Takeaway that answers "so what?"</b> — Evidence from the chat with specific names/tools/numbers.
 - If you can't explain why someone should care, cut the bullet.
-- If a section has nothing, write "Nothing today." One line.
+- If a section has nothing, write "Nothing this {span}." One line.
 - NEVER repeat a point.
 
 EVERY bullet MUST include a direct quote from the chat as evidence. Format:
 <b>Takeaway</b> — Context. As user_x put it: "exact quote from the log."
 
-DATA: {msg_count} messages from the tinygrad Discord #general on {date_str}. This is geohot's community — hackers, kernel devs, GPU/TPU infra people, and ML engineers who care about performance and open-source AI hardware.
+DATA: time-sliced notes condensed from {msg_count} messages in the tinygrad Discord #general, {date_str}. This is geohot's community — hackers, kernel devs, GPU/TPU infra people, and ML engineers who care about performance and open-source AI hardware. Each section is headed by its UTC time range; quotes in the notes are verbatim from the chat.
 
 {messages}
 
 OUTPUT (use these exact section headers):
 
 TL;DR
-One bold sentence. The single most important signal today. Why it matters.
+One bold sentence. The single most important signal this {span}. Why it matters.
 
 TINYGRAD & INFRA
 Changes to tinygrad itself, new backends, driver hacks, performance wins, kernel optimizations.
@@ -128,30 +140,30 @@ Repos, posts, or tools that sparked real discussion. Include the URL and why it
         "name": "seats.aero #pro-chat",
         "guild_id": "1081857313096343672",
         "channel_id": "1092683036316926022",
-        "cadence": "weekly",
+        "windows": ["flash", "daily", "weekly"],
         "label": "seats-aero",
         "email_subject": "seats.aero Weekly Digest",
-        "prompt": """You are a sharp intelligence analyst writing a daily brief for a travel-hacking exec. They will skim this in 60 seconds. Every word must earn its place.
+        "prompt": """You are a sharp intelligence analyst writing a {period} brief for a travel-hacking exec. They will skim this in 60 seconds. Every word must earn its place.
 
 RULES:
 - Under 800 words total.
 - EVERY bullet MUST start with a bold actionable takeaway, then a dash, then 1-2 sentences of evidence. NO EXCEPTIONS.
 - Format: <b>Takeaway that answers "so what?"</b> — Evidence from the chat with specific names/tools/numbers.
 - If you can't explain why someone should care, cut the bullet.
-- If a section has nothing, write "Nothing today." One line.
+- If a section has nothing, write "Nothing this {span}." One line.
 - NEVER repeat a point.
 
 EVERY bullet MUST include a direct quote from the chat as evidence. Format:
 <b>Takeaway</b> — Context. As user_x put it: "exact quote from the log."
 
-DATA: {msg_count} messages from the seats.aero Pro Discord on {date_str}. These are serious points/miles enthusiasts, credit card optimizers, and award travel hackers.
+DATA: time-sliced notes condensed from {msg_count} messages in the seats.aero Pro Discord, {date_str}. These are serious points/miles enthusiasts, credit card optimizers, and award travel hackers. Each section is headed by its UTC time range; quotes in the notes are verbatim from the chat.
 
 {messages}
 
 OUTPUT (use these exact section headers):
 
 TL;DR
-One bold sentence. The single most actionable signal today.
+One bold sentence. The single most actionable signal this {span}.
 
 AWARD SWEET SPOTS
 Routes with unusual availability, new award chart sweet spots, or redemptions people are actually booking.
@@ -170,32 +182,77 @@ Booking tricks, transfer timing, stacking strategies, or manufactured spending t
     },
 }
 
-WEEKLY_ROLLUP_PROMPT = """You are writing a weekly intelligence rollup for a busy exec. You have 7 daily digests from the past week. Your job is to synthesize them into one concise weekly report.
+ROLLUP_PROMPT = """You are writing a {period} intelligence rollup for a busy exec. You have condensed notes covering the past {span}. Your job is to synthesize them into one concise {period} report.
 
 RULES:
 - Under 1000 words.
-- Lead with the single biggest signal of the week in a TL;DR.
-- Identify TRENDS across the week, not just repeat daily bullets.
+- Lead with the single biggest signal of the {span} in a TL;DR.
+- Identify TRENDS across the {span}, not just repeat individual notes.
 - Drop anything that was only mentioned once with no follow-up — it's noise.
-- Keep direct quotes from the daily digests where they add color.
+- Keep direct quotes from the notes where they add color.
 - NEVER repeat a point.
 
-DAILY DIGESTS:
-{digests}
+NOTES ({msg_count} messages, {date_str}):
+{messages}
 
 OUTPUT (use these exact section headers):
 
 TL;DR
-One bold sentence. The single most important trend or signal this week.
+One bold sentence. The single most important trend or signal this {span}.
 
 TOP SIGNALS
-The 3-5 most important takeaways from the entire week. These should be things that recurred, escalated, or had real impact.
+The 3-5 most important takeaways from the entire {span}. These should be things that recurred, escalated, or had real impact.
 
 EMERGING TRENDS
-Patterns you see forming across multiple days. What's building momentum?
+Patterns you see forming across the {span}. What's building momentum?
 
 NOTABLE LINKS
-The best 3-5 links from the entire week — only the ones that matter."""
+The best 3-5 links from the entire {span} — only the ones that matter."""
+
+BLOCK_NOTES_PROMPT = """Condense this one-hour slice of the {channel} Discord chat into working notes for a later digest. Nobody reads these directly.
+
+RULES:
+- Under 250 words. Plain "- " bullets, no headers.
+- Keep only substance: tools, models, papers, numbers, decisions, deals, strong opinions.
+- Every bullet names who said it and keeps one short VERBATIM quote: username: "exact words".
+- Keep every URL that got discussion, with its title from LINK CONTEXT if present.
+- If nothing substantive happened, reply with exactly: NOTHING
+
+CHAT ({start} to {end} UTC):
+{messages}"""
+
+MERGE_NOTES_PROMPT = """Merge these consecutive sets of working notes from the {channel} Discord into one set covering {start} to {end} UTC. Nobody reads these directly.
+
+RULES:
+- Under 400 words. Plain "- " bullets, no headers.
+- Merge duplicates; when something recurred or escalated, say so (e.g. "came up 3 times").
+- Keep usernames, verbatim quotes and URLs for the strongest points.
+- Drop one-off chatter that went nowhere.
+- If nothing substantive remains, reply with exactly: NOTHING
+
+NOTES:
+{notes}"""
+
+# ── Digest Windows ──
+# "hours" is a trailing span ending at the last full hour; "level" means the
+# last complete calendar week/month, so it is one cached block of that level.
+# Window digests are composed from cached block notes, so a run only reads raw
+# messages for hours it has never summarized.
+WINDOWS = {
+    "flash": {"hours": 6, "prompt": None, "period": "6-hour flash", "span": "6-hour window",
+              "subject": "{subject} Flash — {date_str} ({msg_count} msgs)"},
+    "daily": {"hours": HOURS, "prompt": None, "period": "daily", "span": "day",
+              "subject": "{subject} — {date_str} ({msg_count} msgs)"},
+    "weekly": {"level": "week", "prompt": ROLLUP_PROMPT, "period": "weekly", "span": "week",
+               "subject": "{subject} — Week of {date_str} ({msg_count} msgs)"},
+    "monthly": {"level": "month", "prompt": ROLLUP_PROMPT, "period": "monthly", "span": "month",
+                "subject": "{subject} — {date_str} ({msg_count} msgs)"},
+}
+SUMMARY_RETENTION_DAYS = 40
+# Uncached hours one run may summarize per channel; older gaps are left for
+# later runs and the affected digests are marked partial
+MAX_BACKFILL_HOURS = int(os.environ.get("MAX_BACKFILL_HOURS", "72"))
+NOTHING = "NOTHING"
 
 
 # ── Discord Export ──
@@ -217,22 +274,26 @@ def fetch_page(channel_id, after_id):
         return json.loads(resp.read())
 
 
-def export_messages(channel_id):
-    cutoff = datetime.now(timezone.utc) - timedelta(hours=HOURS)
-    after_id = timestamp_to_snowflake(cutoff)
+def export_messages(channel_id, since=None, until=None):
+    since = since or datetime.now(timezone.utc) - timedelta(hours=HOURS)
+    after_id = timestamp_to_snowflake(since)
+    before_id = timestamp_to_snowflake(until) if until else None
     all_msgs = []
     page = 0
 
-    print(f"  Fetching since {cutoff.strftime('%Y-%m-%d %H:%M UTC')}...")
+    print(f"  Fetching since {since.strftime('%Y-%m-%d %H:%M UTC')}...")
     while True:
         msgs = fetch_page(channel_id, after_id)
         if not msgs:
             break
-        msgs.sort(key=lambda m: int(m["id"]))
-        all_msgs.extend(msgs)
-        after_id = max(int(m["id"]) for m in msgs)
+        in_range = [m for m in msgs if before_id is None or int(m["id"]) < before_id]
+        in_range.sort(key=lambda m: int(m["id"]))
+        all_msgs.extend(in_range)
         page += 1
         print(f"    Page {page}: {len(all_msgs)} messages")
+        if len(in_range) < len(msgs) or not in_range:
+            break
+        after_id = max(int(m["id"]) for m in msgs)
         time.sleep(0.5)
 
     seen = set()
@@ -245,7 +306,7 @@ def export_messages(channel_id):
     return unique
 
 
-def messages_to_text(messages):
+def messages_to_text(messages, link_meta=None):
     lines = []
     for msg in messages:
         author = msg["author"]["username"]
@@ -256,9 +317,251 @@ def messages_to_text(messages):
         if attachments:
             line += f" [attachments: {', '.join(attachments)}]"
         lines.append(line)
+    if link_meta is not None:
+        links, attachments, _ = extract_links(messages)
+        context = [(raw, link_meta.get(norm, {})) for norm, raw in links.items()]
+        context += list(attachments.items())
+        context = [(url, " — ".join(p for p in (m.get("title"), m.get("description")) if p))
+                   for url, m in context]
+        context = [(url, desc) for url, desc in context if desc]
+        if context:
+            lines.append("")
+            lines.append("LINK CONTEXT (what the URLs above point to):")
+            lines.extend(f"- {url} — {desc}" for url, desc in context)
     return "\n".join(lines)
 
 
+# ── Link Enrichment ──
+URL_RE = re.compile(r"https?://[^\s<>\"'`|]+")
+TRACKING_PARAMS = ("ref_src", "fbclid", "gclid", "si")
+
+
+def clean_link(url):
+    """Drop punctuation glued to a URL in prose, keeping balanced parentheses."""
+    while url and url[-1] in ".,;:!?)]}>*_~":
+        if url[-1] == ")" and url.count("(") >= url.count(")"):
+            break
+        url = url[:-1]
+    return url
+
+
+def normalize_url(url):
+    """Canonical cache key: lowercase host, no fragment/tracking params/trailing slash.
+
+    Only used for deduping and caching; requests always go to the URL as posted.
+    """
+    parts = urllib.parse.urlsplit(url)
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+             if not (k.startswith("utm_") or k in TRACKING_PARAMS)]
+    path = parts.path.rstrip("/") or ""
+    return urllib.parse.urlunsplit(
+        (parts.scheme.lower(), host, path, urllib.parse.urlencode(query), "")
+    )
+
+
+def extract_links(messages):
+    """Unique links in a window, in first-seen order.
+
+    Returns (links, attachments, embeds): links maps each normalized URL to the
+    first spelling posted; attachments and embeds map URLs to metadata Discord
+    already gave us, so those never need fetching.
+    """
+    links, attachments, embeds = {}, {}, {}
+    for msg in messages:
+        for raw in URL_RE.findall(msg.get("content") or ""):
+            raw = clean_link(raw)
+            try:
+                links.setdefault(normalize_url(raw), raw)
+            except ValueError:  # e.g. "https://[oops" is not a parseable URL
+                continue
+        for e in msg.get("embeds", []):
+            if e.get("url") and (e.get("title") or e.get("description")):
+                try:
+                    key = normalize_url(e["url"])
+                except ValueError:
+                    continue
+                embeds.setdefault(key, {
+                    "title": (e.get("title") or "")[:200],
+                    "description": " ".join((e.get("description") or "").split())[:300],
+                })
+        for a in msg.get("attachments", []):
+            parts = [a.get("content_type", ""), f"{a.get('size', 0) // 1024} KB"]
+            if a.get("width") and a.get("height"):
+                parts.append(f"{a['width']}x{a['height']}")
+            attachments[a["url"]] = {
+                "title": a.get("filename", ""),
+                "description": ", ".join(p for p in parts if p),
+            }
+    return links, attachments, embeds
+
+
+class _MetaParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.meta = {}
+        self._in_title = False
+        self._title = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            if key in ("og:title", "og:description", "description", "twitter:title",
+                       "twitter:description") and attrs.get("content"):
+                self.meta.setdefault(key, attrs["content"].strip())
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title.append(data)
+
+    def result(self):
+        title = (self.meta.get("og:title") or self.meta.get("twitter:title")
+                 or " ".join("".join(self._title).split()))
+        desc = (self.meta.get("og:description") or self.meta.get("description")
+                or self.meta.get("twitter:description") or "")
+        return {"title": title[:200], "description": " ".join(desc.split())[:300]}
+
+
+def fetch_link_meta(url, timeout=10):
+    """Resolve a URL to {"title", "description"} from its HTML head."""
+    req = urllib.request.Request(url, headers={
+        "User-Agent": "Mozilla/5.0 (compatible; DiscordDigest/1.0)",
+        "Accept": "text/html,application/xhtml+xml",
+    })
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        ctype = resp.headers.get_content_type()
+        if ctype not in ("text/html", "application/xhtml+xml"):
+            name = urllib.parse.urlsplit(resp.geturl()).path.rsplit("/", 1)[-1]
+            return {"title": name, "description": ctype}
+        charset = resp.headers.get_content_charset() or "utf-8"
+        body = resp.read(LINK_MAX_BYTES).decode(charset, errors="replace")
+    parser = _MetaParser()
+    parser.feed(body)
+    return parser.result()
+
+
+class HostLimiter:
+    """Caps concurrent requests per host and spaces out their start times."""
+
+    def __init__(self, per_host=LINK_PER_HOST, delay=LINK_HOST_DELAY):
+        self.per_host = per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._sems = {}
+        self._next_start = {}
+
+    def __call__(self, host):
+        with self._lock:
+            sem = self._sems.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        return _HostSlot(self, host, sem)
+
+    def _wait_turn(self, host):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+
+class _HostSlot:
+    def __init__(self, limiter, host, sem):
+        self.limiter, self.host, self.sem = limiter, host, sem
+
+    def __enter__(self):
+        self.sem.acquire()
+        self.limiter._wait_turn(self.host)
+
+    def __exit__(self, *exc):
+        self.sem.release()
+
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_cache(cache, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _cache_fresh(entry, now, ttl):
+    # Failures are retried after a day rather than the full TTL
+    if entry.get("error"):
+        ttl = min(ttl, timedelta(days=1))
+    return now - datetime.fromisoformat(entry["fetched_at"]) < ttl
+
+
+def prune_url_cache(cache, now, ttl):
+    for key in [k for k, entry in cache.items() if not _cache_fresh(entry, now, ttl)]:
+        del cache[key]
+
+
+def resolve_urls(links, cache, workers=LINK_WORKERS, limiter=None,
+                 ttl=timedelta(days=LINK_CACHE_TTL_DAYS), fetch=fetch_link_meta):
+    """Fill `cache` for every link that is missing or stale, fetching concurrently.
+
+    `links` maps cache keys (normalized URLs) to the URL to request.
+    Returns {key: {"title", "description"}} for the requested links.
+    """
+    now = datetime.now(timezone.utc)
+    limiter = limiter or HostLimiter()
+    todo = [k for k in links if k not in cache or not _cache_fresh(cache[k], now, ttl)]
+
+    def work(key):
+        url = links[key]
+        try:
+            with limiter(urllib.parse.urlsplit(url).netloc.lower()):
+                meta = fetch(url)
+            err = ""
+        except Exception as e:
+            meta, err = {"title": "", "description": ""}, str(e)[:200]
+        return key, {**meta, "error": err,
+                     "fetched_at": datetime.now(timezone.utc).isoformat()}
+
+    if todo:
+        print(f"  Resolving {len(todo)} links ({len(links) - len(todo)} cached)...")
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as pool:
+            for key, entry in pool.map(work, todo):
+                cache[key] = entry
+    return {k: {"title": cache[k]["title"], "description": cache[k]["description"]}
+            for k in links}
+
+
+def enrich_links(messages, cache_path=None, **resolve_kwargs):
+    """Titles/descriptions for every link in a window, keyed by normalized URL.
+
+    Discord's own embeds are used first; only the rest hit the network.
+    """
+    cache_path = cache_path or os.path.join(CACHE_DIR, "url_cache.json")
+    links, _, embeds = extract_links(messages)
+    cache = load_cache(cache_path)
+    fetched_at = datetime.now(timezone.utc).isoformat()
+    for key, meta in embeds.items():
+        cache[key] = {**meta, "error": "", "fetched_at": fetched_at}
+    meta = resolve_urls(links, cache, **resolve_kwargs)
+    prune_url_cache(cache, datetime.now(timezone.utc),
+                    resolve_kwargs.get("ttl", timedelta(days=LINK_CACHE_TTL_DAYS)))
+    save_cache(cache, cache_path)
+    return meta
+
+
 # ── Gemini Flash ──
 def call_gemini(prompt_text):
     url = (f"https://generativelanguage.googleapis.com/v1beta/models/"
@@ -277,8 +580,18 @@ def call_gemini(prompt_text):
         url, data=data,
         headers={"Content-Type": "application/json"},
     )
-    with urllib.request.urlopen(req, timeout=120) as resp:
-        result = json.loads(resp.read())
+    for attempt in range(GEMINI_RETRIES + 1):
+        try:
+            with urllib.request.urlopen(req, timeout=120) as resp:
+                result = json.loads(resp.read())
+            break
+        except urllib.error.HTTPError as e:
+            if attempt == GEMINI_RETRIES or not (e.code == 429 or e.code >= 500):
+                raise
+            retry_after = e.headers.get("Retry-After", "")
+            wait = int(retry_after) if retry_after.isdigit() else 5 * 2 ** attempt
+            print(f"  Gemini {e.code}, retrying in {wait}s ({attempt + 1}/{GEMINI_RETRIES})...")
+            time.sleep(wait)
     return result["candidates"][0]["content"]["parts"][0]["text"]
 
 
@@ -302,24 +615,6 @@ def post_issue(subject, body, labels):
     print(f"  Posted: {result['html_url']}")
 
 
-def fetch_recent_issues(label, days=7):
-    """Fetch issues with a given label from the last N days."""
-    if not GITHUB_TOKEN or not GITHUB_REPO:
-        return []
-    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
-    url = (f"https://api.github.com/repos/{GITHUB_REPO}/issues"
-           f"?labels={label}&state=all&since={since}&per_page=30&sort=created&direction=asc")
-    req = urllib.request.Request(
-        url,
-        headers={
-            "Authorization": f"Bearer {GITHUB_TOKEN}",
-            "Accept": "application/vnd.github+json",
-        },
-    )
-    with urllib.request.urlopen(req) as resp:
-        return json.loads(resp.read())
-
-
 # ── Markdown to HTML ──
 def md_to_html(text):
     lines = text.split("\n")
@@ -397,98 +692,261 @@ def send_email(subject, body, from_name="Discord Digest"):
         print(f"  Resend failed: {e}")
 
 
-# ── Daily extraction (runs for all channels) ──
-def run_daily():
-    date_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    mode = os.environ.get("DIGEST_CHANNELS", "all")  # "all", "daily", or specific key
-
-    for key, cfg in CHANNELS.items():
-        if mode == "daily" and cfg["cadence"] != "daily":
-            continue
-        if mode not in ("all", "daily") and mode != key:
-            continue
+# ── Hierarchical block summaries ──
+LEVELS = ["hour", "day", "week", "month"]
+
+
+def block_aligned(level, t):
+    if t.minute or t.second or t.microsecond:
+        return False
+    if level == "hour":
+        return True
+    if t.hour:
+        return False
+    if level == "day":
+        return True
+    if level == "week":
+        return t.weekday() == 0
+    return t.day == 1
+
+
+def block_start(level, t):
+    """Start of the `level` block containing `t`."""
+    t = t.replace(minute=0, second=0, microsecond=0)
+    if level == "hour":
+        return t
+    t = t.replace(hour=0)
+    if level == "day":
+        return t
+    if level == "week":
+        return t - timedelta(days=t.weekday())
+    return t.replace(day=1)
+
+
+def block_end(level, t):
+    if level == "hour":
+        return t + timedelta(hours=1)
+    if level == "day":
+        return t + timedelta(days=1)
+    if level == "week":
+        return t + timedelta(days=7)
+    return (t.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def cover(start, end, top="month"):
+    """Split [start, end) into the fewest calendar-aligned blocks no larger than `top`.
+
+    A trailing window like 08:00 Mon -> 08:00 Tue becomes 16 hours + 8 hours;
+    a month becomes its whole weeks plus the leftover days on either side.
+    """
+    blocks, t = [], start
+    levels = LEVELS[:LEVELS.index(top) + 1]
+    while t < end:
+        level = next(lv for lv in reversed(levels)
+                     if block_aligned(lv, t) and block_end(lv, t) <= end)
+        blocks.append((level, t))
+        t = block_end(level, t)
+    return blocks
+
+
+def block_key(level, t):
+    return f"{level}:{t.strftime('%Y-%m-%dT%H')}"
+
+
+def join_notes(blocks, entries):
+    """Child notes, each under a header with its UTC time range."""
+    return "\n\n".join(
+        f"--- {t.strftime('%Y-%m-%d %H:%M')}–{block_end(lv, t).strftime('%Y-%m-%d %H:%M')} UTC ---\n"
+        f"{e['notes']}"
+        for (lv, t), e in zip(blocks, entries) if e["notes"]
+    )
 
-        print(f"\n{'='*50}")
-        print(f"{cfg['name']}")
-        print(f"{'='*50}")
 
-        messages = export_messages(cfg["channel_id"])
-        if not messages:
-            print(f"  No messages. Skipping.")
+def missing_hours(blocks, cache):
+    """Hour blocks whose raw messages are needed to fill the uncached parts of `blocks`."""
+    hours = []
+    for level, t in blocks:
+        if block_key(level, t) in cache:
             continue
+        if level == "hour":
+            hours.append(t)
+        else:
+            below = LEVELS[LEVELS.index(level) - 1]
+            hours.extend(missing_hours(cover(t, block_end(level, t), below), cache))
+    return hours
+
+
+def slice_messages(messages, start, end):
+    lo, hi = timestamp_to_snowflake(start), timestamp_to_snowflake(end)
+    return [m for m in messages if lo <= int(m["id"]) < hi]
+
+
+def summarize_block(level, t, ctx):
+    """Notes for one block, built from raw messages (hours) or the level below."""
+    key = block_key(level, t)
+    if key in ctx["cache"]:
+        return ctx["cache"][key]
+    end = block_end(level, t)
+    span = {"channel": ctx["name"], "start": t.strftime("%Y-%m-%d %H:%M"),
+            "end": end.strftime("%Y-%m-%d %H:%M")}
+
+    if level == "hour":
+        if t not in ctx["fetched"]:
+            # Beyond this run's backfill budget: leave it for a later run
+            return {"notes": "", "msgs": 0, "partial": True}
+        msgs = slice_messages(ctx["messages"], t, end)
+        notes = ""
+        if msgs:
+            notes = call_gemini(BLOCK_NOTES_PROMPT.format(
+                messages=messages_to_text(msgs, ctx["links"]), **span))
+            time.sleep(1)
+        entry = {"notes": notes, "msgs": len(msgs)}
+    else:
+        below = LEVELS[LEVELS.index(level) - 1]
+        blocks = cover(t, end, below)
+        children = [summarize_block(lv, ct, ctx) for lv, ct in blocks]
+        parts = [c["notes"] for c in children if c["notes"]]
+        msgs = sum(c["msgs"] for c in children)
+        if any(c.get("partial") for c in children):
+            # Not worth a merge call for a block that can't be cached yet
+            return {"notes": join_notes(blocks, children), "msgs": msgs, "partial": True}
+        if len(parts) > 1:
+            notes = call_gemini(MERGE_NOTES_PROMPT.format(
+                notes=join_notes(blocks, children), **span))
+            time.sleep(1)
+        else:
+            notes = parts[0] if parts else ""
+        entry = {"notes": notes, "msgs": msgs}
+
+    if entry["notes"].strip() == NOTHING:
+        entry["notes"] = ""
+    ctx["cache"][key] = entry
+    # Save as we go so a crash or timeout keeps the notes already paid for
+    save_cache(ctx["cache"], ctx["cache_path"])
+    return entry
+
+
+def prune_summaries(cache, now):
+    cutoff = now - timedelta(days=SUMMARY_RETENTION_DAYS)
+    for key in list(cache):
+        t = datetime.strptime(key.split(":", 1)[1], "%Y-%m-%dT%H").replace(tzinfo=timezone.utc)
+        if t < cutoff:
+            del cache[key]
+
+
+# ── Window digests (one fetch per channel, many resolutions) ──
+def window_range(name, now):
+    """[start, end) covered by window `name` for a run at `now`."""
+    win = WINDOWS[name]
+    end = block_start("hour", now)
+    if "level" in win:
+        end = block_start(win["level"], end)
+        return block_start(win["level"], end - timedelta(hours=1)), end
+    return end - timedelta(hours=win["hours"]), end
+
+
+def window_date_str(name, start, end):
+    if name == "flash":
+        return f"{start.strftime('%Y-%m-%d %H:%M')}–{end.strftime('%H:%M')} UTC"
+    if name == "daily":
+        return end.strftime("%Y-%m-%d")
+    if name == "monthly":
+        return start.strftime("%B %Y")
+    return start.strftime("%Y-%m-%d")
+
+
+def run_channel(key, cfg, due, now):
+    print(f"\n{'='*50}")
+    print(f"{cfg['name']} [{', '.join(due)}]")
+    print(f"{'='*50}")
+
+    cache_path = os.path.join(CACHE_DIR, "summaries", f"{key}.json")
+    cache = load_cache(cache_path)
+    ranges = {n: window_range(n, now) for n in due}
+    plans = {n: cover(*ranges[n]) for n in due}
 
-        text = messages_to_text(messages)
-        print(f"  {len(messages)} messages, {len(text)} chars")
-
-        print(f"  Calling Gemini Flash...")
-        prompt_text = cfg["prompt"].format(
-            messages=text, date_str=date_str, msg_count=len(messages)
-        )
-        analysis = call_gemini(prompt_text)
-        print(f"  Analysis complete.")
-
-        # Post as GitHub issue with channel-specific label
-        subject = f"{cfg['email_subject']} — {date_str} ({len(messages)} msgs)"
-        post_issue(subject, analysis, ["digest", cfg["label"]])
-
-        # Email every channel's digest
-        send_email(subject, analysis, cfg["email_subject"])
-
-        time.sleep(2)  # be nice between channels
-
+    try:
+        # Single fetch spanning every hour not yet summarized, for all windows
+        hours = sorted({h for blocks in plans.values() for h in missing_hours(blocks, cache)})
+        if len(hours) > MAX_BACKFILL_HOURS:
+            print(f"  {len(hours)} uncached hours; summarizing the latest "
+                  f"{MAX_BACKFILL_HOURS}, older ones on later runs")
+            hours = hours[-MAX_BACKFILL_HOURS:]
+        messages = (export_messages(cfg["channel_id"], hours[0], hours[-1] + timedelta(hours=1))
+                    if hours else [])
+        print(f"  {len(messages)} new messages, {len(hours)} hours to summarize")
+        ctx = {"name": cfg["name"], "cache": cache, "cache_path": cache_path,
+               "messages": messages, "fetched": set(hours),
+               "links": enrich_links(messages) if messages else {}}
+
+        for name in due:
+            win = WINDOWS[name]
+            blocks = plans[name]
+            print(f"  [{name}] composing from {len(blocks)} blocks...")
+            entries = [summarize_block(lv, t, ctx) for lv, t in blocks]
+            msg_count = sum(e["msgs"] for e in entries)
+            partial = any(e.get("partial") for e in entries)
+            notes = join_notes(blocks, entries)
+            if not notes:
+                print(f"  [{name}] Nothing to report. Skipping.")
+                continue
 
-# ── Weekly rollup (runs for weekly channels) ──
-def run_weekly():
-    date_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            date_str = window_date_str(name, *ranges[name])
+            print(f"  [{name}] Calling Gemini Flash ({msg_count} msgs, {len(notes)} chars)...")
+            prompt = win["prompt"] or cfg["prompt"]
+            analysis = call_gemini(prompt.format(
+                messages=notes, date_str=date_str, msg_count=msg_count,
+                period=win["period"], span=win["span"],
+            ))
+            print(f"  [{name}] Analysis complete.")
+
+            subject = win["subject"].format(
+                subject=cfg["email_subject"], date_str=date_str, msg_count=msg_count)
+            if partial:
+                subject += " [partial: backfill still running]"
+            labels = ["digest", cfg["label"]] + ([] if name == "daily" else [name])
+            post_issue(subject, analysis, labels)
+            send_email(subject, analysis, cfg["email_subject"])
+            time.sleep(2)
+    finally:
+        prune_summaries(cache, now)
+        save_cache(cache, cache_path)
+
+
+def run_windows(names):
+    """Run every due window for each channel; returns the channel keys that failed."""
+    now = datetime.now(timezone.utc)
+    mode = os.environ.get("DIGEST_CHANNELS", "all")  # "all", a window name, or specific key
+    failed = []
 
     for key, cfg in CHANNELS.items():
-        if cfg["cadence"] != "weekly":
+        if mode in WINDOWS and mode not in cfg["windows"]:
             continue
-
-        print(f"\n{'='*50}")
-        print(f"WEEKLY ROLLUP: {cfg['name']}")
-        print(f"{'='*50}")
-
-        # Fetch last 7 daily digests from GitHub issues
-        issues = fetch_recent_issues(cfg["label"], days=7)
-        if not issues:
-            print(f"  No daily digests found. Skipping.")
+        if mode not in ("all", *WINDOWS) and mode != key:
             continue
-
-        # Build digest text from issue bodies
-        digests = []
-        for issue in issues:
-            # Skip weekly rollup issues
-            if "weekly" in issue.get("title", "").lower():
-                continue
-            digests.append(f"--- {issue['title']} ---\n{issue['body']}")
-
-        if not digests:
-            print(f"  No daily digests to roll up. Skipping.")
+        due = [n for n in names if n in cfg["windows"]]
+        if not due:
             continue
 
-        combined = "\n\n".join(digests)
-        print(f"  {len(digests)} daily digests, {len(combined)} chars")
-
-        print(f"  Calling Gemini Flash for rollup...")
-        prompt_text = WEEKLY_ROLLUP_PROMPT.format(digests=combined)
-        rollup = call_gemini(prompt_text)
-        print(f"  Rollup complete.")
+        try:
+            run_channel(key, cfg, due, now)
+        except Exception as e:
+            print(f"  {cfg['name']} failed: {e!r}. Moving on.")
+            failed.append(key)
 
-        subject = f"{cfg['email_subject']} — Week of {date_str} ({len(digests)} days)"
-        post_issue(subject, rollup, ["digest", cfg["label"], "weekly"])
-        send_email(subject, rollup, cfg["email_subject"])
-
-        time.sleep(2)
+        time.sleep(2)  # be nice between channels
+    return failed
 
 
 # ── Main ──
 def main():
-    mode = sys.argv[1] if len(sys.argv) > 1 else "daily"
-    if mode == "weekly":
-        run_weekly()
-    else:
-        run_daily()
+    names = sys.argv[1:] or ["daily"]
+    unknown = [n for n in names if n not in WINDOWS]
+    if unknown:
+        sys.exit(f"Unknown window(s): {', '.join(unknown)}. Choose from: {', '.join(WINDOWS)}")
+    failed = run_windows(names)
+    if failed:
+        sys.exit(f"Failed channels: {', '.join(failed)}")
 
 
 if __name__ == "__main__":
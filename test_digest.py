@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Tests for link enrichment (against a local stand-in HTTP server) and for
+hierarchical digest windows (with Discord and Gemini stubbed out).
+python -m unittest test_digest
+"""
+
+import http.server
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import digest
+
+
+class StandIn(http.server.BaseHTTPRequestHandler):
+    hits = []
+
+    def do_GET(self):
+        StandIn.hits.append((self.headers["Host"], self.path, time.monotonic()))
+        if self.path.endswith(".pdf"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.end_headers()
+            self.wfile.write(b"%PDF-1.4")
+            return
+        if self.path.startswith("/missing"):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        if self.path.startswith("/og"):
+            head = ('<title>Plain title</title>'
+                    '<meta property="og:title" content="OG title">'
+                    '<meta property="og:description" content="OG  description">')
+        else:
+            head = f'<title>\n  Page {self.path}\n</title><meta name="description" content="About {self.path}">'
+        self.wfile.write(f"<html><head>{head}</head><body></body></html>".encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def msg(content, **extra):
+    return {"id": "1", "content": content, "author": {"username": "u"},
+            "timestamp": "2026-01-01T00:00:00+00:00", "attachments": [], **extra}
+
+
+class LinkEnrichmentTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StandIn.hits.clear()
+        self.cache_path = os.path.join(tempfile.mkdtemp(), "url_cache.json")
+
+    def enrich(self, messages, delay=0.0):
+        return digest.enrich_links(messages, self.cache_path,
+                                   limiter=digest.HostLimiter(per_host=2, delay=delay))
+
+    def test_title_and_og_parsing(self):
+        b = self.base
+        meta = self.enrich([msg(f"{b}/og and {b}/plain/ and {b}/paper.pdf and {b}/missing")])
+        self.assertEqual(meta[f"{b}/og"], {"title": "OG title", "description": "OG description"})
+        self.assertEqual(meta[f"{b}/plain"], {"title": "Page /plain/", "description": "About /plain/"})
+        self.assertEqual(meta[f"{b}/paper.pdf"], {"title": "paper.pdf", "description": "application/pdf"})
+        self.assertEqual(meta[f"{b}/missing"], {"title": "", "description": ""})
+
+    def test_fetches_url_as_posted_and_prints_that_spelling(self):
+        b = self.base
+        messages = [msg(f"see {b}/wiki/Foo_(bar)."), msg(f"again {b}/wiki/Foo_(bar)/#top")]
+        meta = self.enrich(messages)
+        self.assertEqual([h[1] for h in StandIn.hits], ["/wiki/Foo_(bar)"])
+        text = digest.messages_to_text(messages, meta)
+        self.assertIn(f"- {b}/wiki/Foo_(bar) — Page /wiki/Foo_(bar)", text)
+
+    def test_discord_embeds_skip_network(self):
+        url = f"{self.base}/embedded"
+        embed = {"url": url, "title": "Embedded title", "description": "From Discord"}
+        meta = self.enrich([msg(url, embeds=[embed])])
+        self.assertEqual(StandIn.hits, [])
+        self.assertEqual(meta[url], {"title": "Embedded title", "description": "From Discord"})
+
+    def test_malformed_url_is_skipped(self):
+        messages = [msg(f"broken https://[oops and {self.base}/ok")]
+        meta = self.enrich(messages)
+        self.assertEqual(list(meta), [f"{self.base}/ok"])
+        text = digest.messages_to_text(messages, meta)
+        self.assertIn("https://[oops", text)
+        self.assertIn(f"- {self.base}/ok — Page /ok", text)
+
+    def test_cache_hit_and_ttl_expiry(self):
+        messages = [msg(f"{self.base}/a")]
+        self.enrich(messages)
+        self.enrich(messages)
+        self.assertEqual(len(StandIn.hits), 1)
+
+        cache = digest.load_cache(self.cache_path)
+        old = datetime.now(timezone.utc) - timedelta(days=digest.LINK_CACHE_TTL_DAYS + 1)
+        cache[f"{self.base}/a"]["fetched_at"] = old.isoformat()
+        digest.save_cache(cache, self.cache_path)
+        self.enrich(messages)
+        self.assertEqual(len(StandIn.hits), 2)
+
+    def test_expired_entries_are_pruned(self):
+        old = datetime.now(timezone.utc) - timedelta(days=digest.LINK_CACHE_TTL_DAYS + 1)
+        digest.save_cache({"https://gone.example/x": {
+            "title": "t", "description": "", "error": "", "fetched_at": old.isoformat(),
+        }}, self.cache_path)
+        self.enrich([msg(f"{self.base}/a")])
+        self.assertEqual(list(digest.load_cache(self.cache_path)), [f"{self.base}/a"])
+
+    def test_per_host_spacing(self):
+        port = self.server.server_port
+        urls = [f"http://127.0.0.1:{port}/{i}" for i in range(3)]
+        urls += [f"http://localhost:{port}/{i}" for i in range(3)]
+        self.enrich([msg(" ".join(urls))], delay=0.2)
+
+        by_host = {}
+        for host, _, t in StandIn.hits:
+            by_host.setdefault(host, []).append(t)
+        self.assertEqual(len(by_host), 2)
+        for starts in by_host.values():
+            starts.sort()
+            gaps = [b - a for a, b in zip(starts, starts[1:])]
+            self.assertTrue(all(g >= 0.18 for g in gaps), gaps)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class DigestWindowsTest(unittest.TestCase):
+    CHANNEL = {
+        "name": "Test #chat", "channel_id": "c", "label": "test", "email_subject": "Test Digest",
+        "prompt": "{period} {span} {date_str} {msg_count}\n{messages}",
+        "windows": ["daily", "weekly"],
+    }
+
+    def setUp(self):
+        # One message every 30 minutes for the three weeks before the runs below
+        self.messages = []
+        t = utc(2026, 9, 28)
+        while t < utc(2026, 10, 19, 12):
+            self.messages.append(msg("hi", id=str(digest.timestamp_to_snowflake(t) + 1),
+                                     timestamp=t.isoformat()))
+            t += timedelta(minutes=30)
+        self.prompts, self.fetches, self.posted = [], [], []
+        self.real_export = digest.export_messages
+
+        def fake_gemini(prompt):
+            self.prompts.append(prompt)
+            return "- note"
+
+        def fake_export(channel_id, since=None, until=None):
+            self.fetches.append((since, until))
+            return digest.slice_messages(self.messages, since, until)
+
+        for target, value in [
+            ("call_gemini", fake_gemini),
+            ("export_messages", fake_export),
+            ("post_issue", lambda subject, body, labels: self.posted.append(subject)),
+            ("send_email", lambda *args, **kwargs: None),
+            ("CACHE_DIR", tempfile.mkdtemp()),
+        ]:
+            patcher = mock.patch.object(digest, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(digest.time, "sleep", lambda seconds: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_channel(self, due, now):
+        digest.run_channel("test", self.CHANNEL, due, now)
+
+    def cache(self):
+        return digest.load_cache(os.path.join(digest.CACHE_DIR, "summaries", "test.json"))
+
+    def test_second_run_makes_no_gemini_calls_for_cached_hours(self):
+        now = utc(2026, 10, 19, 8, 30)
+        self.run_channel(["daily"], now)
+        self.assertEqual(len(self.prompts), 24 + 1)  # one note per hour + the digest
+        self.assertEqual(self.fetches, [(utc(2026, 10, 18, 8), utc(2026, 10, 19, 8))])
+
+        self.prompts.clear()
+        self.fetches.clear()
+        self.run_channel(["daily"], now)
+        self.assertEqual(len(self.prompts), 1)
+        self.assertEqual(self.fetches, [])
+        self.assertIn("--- 2026-10-18 08:00–2026-10-18 09:00 UTC ---", self.prompts[0])
+
+    def test_capped_backfill_posts_partial_and_leaves_parents_uncached(self):
+        with mock.patch.object(digest, "MAX_BACKFILL_HOURS", 24):
+            self.run_channel(["weekly"], utc(2026, 10, 19, 9))
+        self.assertEqual(self.fetches, [(utc(2026, 10, 18), utc(2026, 10, 19))])
+        self.assertEqual(len(self.posted), 1)
+        self.assertTrue(self.posted[0].endswith("[partial: backfill still running]"), self.posted[0])
+
+        cache = self.cache()
+        self.assertIn("day:2026-10-18T00", cache)
+        self.assertNotIn("day:2026-10-17T00", cache)
+        self.assertNotIn("week:2026-10-12T00", cache)
+        self.assertFalse(any(p.startswith("Merge") and "2026-10-12 00:00" in p
+                             for p in self.prompts))
+
+        # With room in the budget the next run completes the week and caches it
+        self.posted.clear()
+        with mock.patch.object(digest, "MAX_BACKFILL_HOURS", 24 * 7):
+            self.run_channel(["weekly"], utc(2026, 10, 19, 9))
+        self.assertEqual(self.posted, ["Test Digest — Week of 2026-10-12 (336 msgs)"])
+        self.assertIn("week:2026-10-12T00", self.cache())
+
+    def test_monthly_window_is_one_cached_month_block(self):
+        start, end = digest.window_range("monthly", utc(2026, 10, 1, 10, 5))
+        self.assertEqual((start, end), (utc(2026, 9, 1), utc(2026, 10, 1)))
+        self.assertEqual(digest.cover(start, end), [("month", utc(2026, 9, 1))])
+        self.assertEqual(digest.window_date_str("monthly", start, end), "September 2026")
+        self.assertEqual(digest.window_range("monthly", utc(2027, 1, 1, 10)),
+                         (utc(2026, 12, 1), utc(2027, 1, 1)))
+
+    def test_cover_splits_trailing_week_and_month_boundary(self):
+        self.assertEqual(
+            digest.cover(utc(2026, 10, 12, 8), utc(2026, 10, 19, 8)),
+            [("hour", utc(2026, 10, 12, h)) for h in range(8, 24)]
+            + [("day", utc(2026, 10, d)) for d in range(13, 19)]
+            + [("hour", utc(2026, 10, 19, h)) for h in range(8)],
+        )
+        self.assertEqual(
+            digest.cover(utc(2026, 9, 30), utc(2026, 11, 3)),
+            [("day", utc(2026, 9, 30)), ("month", utc(2026, 10, 1)),
+             ("day", utc(2026, 11, 1)), ("day", utc(2026, 11, 2))],
+        )
+        # A month is composed from its whole weeks plus the leftover days
+        self.assertEqual(
+            digest.cover(utc(2026, 10, 1), utc(2026, 11, 1), "week"),
+            [("day", utc(2026, 10, d)) for d in range(1, 5)]
+            + [("week", utc(2026, 10, d)) for d in (5, 12, 19)]
+            + [("day", utc(2026, 10, d)) for d in range(26, 32)],
+        )
+        self.assertEqual(digest.block_end("month", utc(2026, 12, 1)), utc(2027, 1, 1))
+        self.assertEqual(digest.block_end("month", utc(2027, 1, 1)), utc(2027, 2, 1))
+
+    def test_missing_hours_skips_cached_blocks(self):
+        cache = {"day:2026-10-13T00": {"notes": "", "msgs": 0}}
+        hours = digest.missing_hours([("week", utc(2026, 10, 12))], cache)
+        self.assertEqual(len(hours), 6 * 24)
+        self.assertNotIn(utc(2026, 10, 13, 5), hours)
+
+    def test_export_messages_stops_at_until(self):
+        pages = []
+
+        def fake_page(channel_id, after_id):
+            page = [m for m in self.messages if int(m["id"]) > after_id][:100]
+            pages.append(page)
+            return page
+
+        with mock.patch.object(digest, "fetch_page", fake_page):
+            got = self.real_export("c", utc(2026, 10, 1), utc(2026, 10, 2))
+        self.assertEqual(len(got), 48)
+        self.assertEqual(len(pages), 1)
+        self.assertTrue(all(int(m["id"]) < digest.timestamp_to_snowflake(utc(2026, 10, 2))
+                            for m in got))
+
+
+if __name__ == "__main__":
+    unittest.main()